@@ -2,10 +2,18 @@
     Outputs an HTML webpage to stdout to visualize a set of colors
 '''
 
+import io
+
+
+COLOR_CSS_TMPL = '.color-{name} {{\n\tcolor: {css}\n}}\n'
+ROW_TMPL = ('<tr><td>{name}</td><td class="color-{name}">{name}</td>'
+            '<td style="background-color: {css}; padding-left:200px;">'
+            '</td></tr>\n')
+
 
 def mkColor(name, color):
     ''' Converts a `name` and `rgb` (any CSS format) to a few CSS lines '''
-    return '.color-{} {{\n\tcolor: {}\n}}\n'.format(name, color)
+    return COLOR_CSS_TMPL.format(name=name, css=color)
 
 
 CSS_COLORS = {
@@ -28,23 +36,23 @@ CSS_COLORS = {
 }
 
 
-css = ''
-for color in CSS_COLORS:
-    css += mkColor(color, CSS_COLORS[color])
-css += '''
+TABLE_CSS = '''
 table {
     width: 40%;
     padding: 30px;
 }
 '''
 
-content = ''
-for color in CSS_COLORS:
-    content += ('<tr><td>{}</td><td class="color-{}">{}</td>' +
-                '<td style="background-color: {}; padding-left:200px;">' +
-                '</td></tr>\n').format(
-                    color, color, color, CSS_COLORS[color])
+buf = io.StringIO()
+for color, css_color in CSS_COLORS.items():
+    buf.write(mkColor(color, css_color))
+buf.write(TABLE_CSS)
+css = buf.getvalue()
+
+ROWS = [ROW_TMPL.format(name=color, css=css_color)
+        for color, css_color in CSS_COLORS.items()]
 
+content = ''.join(ROWS)
 content = '''<table style="background-color: white; color: black; float: left">
 {}
 </table>
@@ -53,15 +61,19 @@ content = '''<table style="background-color: white; color: black; float: left">
 </table>
 '''.format(content, content)
 
-page = '''
+PAGE_HEADER = '''
 <html>
   <head>
     <style>
-''' + css + '''
+'''
+PAGE_MIDDLE = '''
     </style>
   </head>
   <body>
-''' + content + '''
+'''
+PAGE_FOOTER = '''
 </html>'''
 
+page = ''.join((PAGE_HEADER, css, PAGE_MIDDLE, content, PAGE_FOOTER))
+
 print(page)
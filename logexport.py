@@ -24,11 +24,9 @@
 
 import weechat
 import time
-from datetime import timedelta
-from datetime import date
-from datetime import time as dtime
-from datetime import datetime
 from collections import namedtuple
+from collections import deque
+import functools
 import os.path
 import re
 
@@ -52,19 +50,43 @@ for option, default_value in SCRIPT_OPTIONS_DEFAULT.items():
     if not weechat.config_is_set_plugin(option):
         weechat.config_set_plugin(option, default_value)
 
+# These are constant for the whole weechat session
+HDATA_BUFFER = weechat.hdata_get('buffer')
+HDATA_LINES = weechat.hdata_get('lines')
+HDATA_LINE = weechat.hdata_get('line')
+HDATA_LINE_DATA = weechat.hdata_get('line_data')
+
+# Cached values of the script options, `None` for unset ones
+CONFIG = {}
+
+
+def loadConfig():
+    ''' (Re)loads every script option into `CONFIG` '''
+    for option in SCRIPT_OPTIONS_DEFAULT:
+        CONFIG[option] = (weechat.config_get_plugin(option)
+                          if weechat.config_is_set_plugin(option) else None)
+
+
+def logexport_config_cb(data, option, value):
+    ''' Called by weechat whenever one of our options is changed '''
+    loadConfig()
+    return weechat.WEECHAT_RC_OK
+
+
+loadConfig()
+weechat.hook_config(SCRIPT_OPTIONS_PREFIX + '*', 'logexport_config_cb', '')
+
 
 ''' ##### HELP TEXT AND MESSAGES ########################################## '''
 
 
+UNLINES_REGEX = re.compile(r'(?<!\n)\n')
+
+
 def unlines(msg):
     """ Remove singne \n, keep only double \n's """
-    out = ""
-    for pos in range(len(msg)):
-        ch = msg[pos]
-        if ch == '\n' and (pos == 0 or msg[pos-1] != '\n'):
-            continue
-        out += msg[pos]
-    return out
+    # Drops every \n that does not follow another \n
+    return UNLINES_REGEX.sub('', msg)
 
 
 HELP_TEXT = unlines("""
@@ -125,35 +147,34 @@ Exports the whole buffer's contents.\n
 """
 
 
-def wrapInHtml(wrapped):
-    ''' Wraps the return value of `wrapped` in a HTML context (with CSS) '''
-
-    DARKMODE_OPTION = 'dark_theme'
-
-    def mkColorCSS(name, color):
-        ''' Converts a `name` and `rgb` (any CSS format) to a few CSS lines '''
-        return '.color-{} {{\n\tcolor: {}\n}}\n'.format(name, color)
-
-    CSS_COLORS = {
-        'white': 'Beige',
-        'black': 'DarkSlateGrey',
-        'blue': 'DarkSlateBlue',
-        'green': 'ForestGreen',
-        'lightred': 'Tomato',
-        'red': 'Crimson',
-        'magenta': 'MediumVioletRed',
-        'brown': 'Chocolate',
-        'yellow': 'GoldenRod',
-        'lightgreen': 'LightGreen',
-        'cyan': 'LightSeaGreen',
-        'lightcyan': 'LightSkyBlue',
-        'lightblue': 'RoyalBlue',
-        'lightmagenta': 'HotPink',
-        'darkgray': 'DimGrey',
-        'gray': 'LightSlateGrey',
-    }
+DARKMODE_OPTION = 'dark_theme'
+
 
-    CSS_BASE = '''
+def mkColorCSS(name, color):
+    ''' Converts a `name` and `rgb` (any CSS format) to a few CSS lines '''
+    return '.color-{} {{\n\tcolor: {}\n}}\n'.format(name, color)
+
+
+CSS_COLORS = {
+    'white': 'Beige',
+    'black': 'DarkSlateGrey',
+    'blue': 'DarkSlateBlue',
+    'green': 'ForestGreen',
+    'lightred': 'Tomato',
+    'red': 'Crimson',
+    'magenta': 'MediumVioletRed',
+    'brown': 'Chocolate',
+    'yellow': 'GoldenRod',
+    'lightgreen': 'LightGreen',
+    'cyan': 'LightSeaGreen',
+    'lightcyan': 'LightSkyBlue',
+    'lightblue': 'RoyalBlue',
+    'lightmagenta': 'HotPink',
+    'darkgray': 'DimGrey',
+    'gray': 'LightSlateGrey',
+}
+
+CSS_BASE = '''
           .non-human td:nth-child(3) {
             font-style: italic;
           }
@@ -187,12 +208,10 @@ def wrapInHtml(wrapped):
             color: orange;
           }
           .nc-prefix-none {
-          } '''
-
-    for color in CSS_COLORS:
-        CSS_BASE += mkColorCSS(color, CSS_COLORS[color])
+          } ''' + ''.join(mkColorCSS(color, cssColor)
+                          for color, cssColor in CSS_COLORS.items())
 
-    HTML_HEADER = '''<!DOCTYPE html>
+HTML_HEADER = '''<!DOCTYPE html>
     <html>
       <head>
         <meta charset="UTF-8" />
@@ -204,21 +223,21 @@ def wrapInHtml(wrapped):
       <body>
     '''
 
-    HTML_FOOTER = '  </body>\n</html>'
-
-    def wrapper(*args, **kwargs):
-        if not weechat.config_is_set_plugin(DARKMODE_OPTION):
-            raise (Exception
-                   ("Option {} is not set. Set it to 'yes' or 'no'.".format(
-                       SCRIPT_OPTIONS_PREFIX + DARKMODE_OPTION)))
-        isDark = weechat.config_get_plugin(DARKMODE_OPTION) == 'on'
-        bgColor = '#050505' if isDark else '#fafafa'
-        fgColor = '#aaa' if isDark else '#555'
-        defaultNickColor = CSS_COLORS['white' if isDark else 'black']
-        dimmedLineColor = '#151515' if isDark else '#eeeeee'
-        nonhumanColor = '#666' if isDark else '#505050'
-
-        formattedCss = '''
+HTML_FOOTER = '  </body>\n</html>'
+
+HTML_FIRST_DAY = '    <h3>{}</h3>\n    <table>\n'
+HTML_NEXT_DAY = '</table>\n' + HTML_FIRST_DAY  # Closes the previous day
+
+
+def mkHtmlHeader(isDark):
+    ''' Builds the HTML header, with the CSS for the required theme '''
+    bgColor = '#050505' if isDark else '#fafafa'
+    fgColor = '#aaa' if isDark else '#555'
+    defaultNickColor = CSS_COLORS['white' if isDark else 'black']
+    dimmedLineColor = '#151515' if isDark else '#eeeeee'
+    nonhumanColor = '#666' if isDark else '#505050'
+
+    formattedCss = '''
           body {{
             font-family: monospace;
             background-color: {bgcolor};
@@ -234,18 +253,50 @@ def wrapInHtml(wrapped):
             color: {nonhumanColor};
           }}
         '''.format(
-            bgcolor=bgColor,
-            fgcolor=fgColor,
-            defaultNickColor=defaultNickColor,
-            dimmedLineColor=dimmedLineColor,
-            nonhumanColor=nonhumanColor,
-        )
-
-        res = wrapped(*args, **kwargs)
-        return (HTML_HEADER.format(css=(CSS_BASE + formattedCss))
-                + res + HTML_FOOTER)
-
-    return wrapper
+        bgcolor=bgColor,
+        fgcolor=fgColor,
+        defaultNickColor=defaultNickColor,
+        dimmedLineColor=dimmedLineColor,
+        nonhumanColor=nonhumanColor,
+    )
+    return HTML_HEADER.format(css=(CSS_BASE + formattedCss))
+
+
+# There are only two themes: build both headers once, at load time
+HTML_HEADERS = {isDark: mkHtmlHeader(isDark) for isDark in (False, True)}
+
+
+def htmlHeader():
+    ''' Returns the HTML header, with the CSS for the configured theme '''
+    darkTheme = CONFIG[DARKMODE_OPTION]
+    if darkTheme is None:
+        raise (Exception
+               ("Option {} is not set. Set it to 'yes' or 'no'.".format(
+                   SCRIPT_OPTIONS_PREFIX + DARKMODE_OPTION)))
+    return HTML_HEADERS[darkTheme == 'on']
+
+
+HTML_ROW = ('    <tr{rowClass}>'
+            '<td>{time}</td>'
+            '<td class="color-{nickColor}">'
+            '<span class="nc-prefix-{nickPrefixColor}">{nickPrefix}</span>'
+            '{nick}</td>'
+            '<td>{msg}</td>'
+            '</tr>\n')
+
+
+def renderRow(timeOfDay, nickPrefix, nick, nickColor, nickPrefixColor,
+              isContinuation, isNonhuman, msg):
+    ''' Formats a table row out of its already escaped (and enhanced) contents.
+    This is pure string work, independent from weechat. '''
+    return HTML_ROW.format(
+        rowClass=' class="non-human"' if isNonhuman else '',
+        time=timeOfDay,
+        nickColor=nickColor,
+        nickPrefixColor=nickPrefixColor,
+        nickPrefix='' if isContinuation else nickPrefix,
+        nick='↳' if isContinuation else nick,
+        msg=msg)
 
 
 ''' ### END HTML ########################################################## '''
@@ -263,32 +314,30 @@ class BadlyFormattedTime(Exception):
 LogLine = namedtuple('LogLine', ['timestamp', 'prefix', 'line'])
 
 
+# HH[:[MM[:[SS]]]], where an omitted part stands for 0
+TIMESTAMP_REGEX = re.compile(r'(\d{1,2})(?::(?:(\d{1,2})(?::(\d{1,2})?)?)?)?')
+
+
 def timestampOfString(timestr):
     """ Converts a timestamp string HH:MM:SS to a weechat timestamp """
-    spl = timestr.strip().split(':')
-    if len(spl) > 3:
+    match = TIMESTAMP_REGEX.fullmatch(timestr.strip())
+    if match is None:
         raise BadlyFormattedTime(timestr)
-    if len(spl) > 1 and spl[-1] == '':  # Allow eg. 18: for 6pm
-        spl[-1] = '0'
-    spl += ['0'] * (3 - len(spl))  # Allow 18:42 for 18:42:00
-
-    try:
-        h, m, s = map(int, spl)
-    except ValueError:
+    hours, minutes, seconds = (int(field or 0) for field in match.groups())
+    if hours >= 24 or minutes >= 60 or seconds >= 60:
         raise BadlyFormattedTime(timestr)
 
-    for (v, bound) in ((h, 24), (m, 60), (s, 60)):
-        if v < 0 or v >= bound:
-            raise BadlyFormattedTime(timestr)
-
-    curDatetime = datetime.now()
-    reqTime = dtime(h, m, s)
-    reqDatetime = datetime.combine(date.today(), reqTime)
-
-    if curDatetime < reqDatetime:
+    # Read the clock once, lest today's date and the current time disagree
+    # around midnight
+    now = time.time()
+    year, month, day = time.localtime(now)[:3]
+    reqTime = time.mktime((year, month, day, hours, minutes, seconds,
+                           0, 0, -1))
+    if now < reqTime:
         # described time is yesterday
-        reqDatetime -= timedelta(days=1)
-    return time.mktime(reqDatetime.timetuple())
+        reqTime = time.mktime((year, month, day - 1, hours, minutes, seconds,
+                               0, 0, -1))
+    return reqTime
 
 
 def formatFilePath(name):
@@ -298,191 +347,227 @@ def formatFilePath(name):
                         + "your log file! :c").format(
                             SCRIPT_OPTIONS_PREFIX + PATH_OPTION))
     PATH_OPTION = 'export_path'
-    if not weechat.config_is_set_plugin(PATH_OPTION):
-        raise_unset()  # exits
-    outdir = weechat.config_get_plugin(PATH_OPTION)
-    if not outdir:
+    outdir = CONFIG[PATH_OPTION]
+    if not outdir:  # Unset or empty
         raise_unset()  # exits
     return os.path.normpath(os.path.expanduser(
         "{}/{}.html".format(outdir, name)))
 
 
-def enhanceMessageLine(msg, colorsRegex, nickColors):
+# This regex was originally taken from
+# http://stackoverflow.com/a/3809435 (but then modified a lot)
+URL_PATTERN = r"(?P<url>\bhttps?://[-a-zA-Z0-9@:%._+~#=?&/]{2,}\b)"
+
+
+EnhanceRegexes = namedtuple('EnhanceRegexes', ['enhance', 'nickWords'])
+
+
+def mkEnhanceRegexes(nicks):
+    """ Compiles the regexes to be fed to `enhanceMessageLine`: `enhance`
+    matches either a URL, in its `url` group, or a word that could be one of
+    `nicks`, in its `nick` group; `nickWords` only matches such words, and is
+    `None` if there are no nicks.
+
+    Nicks are matched between word boundaries, as `\\b(nick1|nick2|...)\\b`
+    would. Most nicks are plain words: every word is matched, and checking it
+    against the nicks is a dict lookup, whereas an alternation of all the nicks
+    would be tried at every position of the message. Only the nicks with other
+    characters, as `jean-luc`, are tried as an alternation, longest first.
+    Words right after a '&' are HTML entities, and are skipped. """
+    if not nicks:
+        return EnhanceRegexes(re.compile(URL_PATTERN), None)
+    candidates = r'\b\w+'
+    otherNicks = sorted((nick for nick in nicks
+                         if nick and not re.fullmatch(r'\w+', nick)),
+                        key=lambda nick: (-len(nick), nick))
+    if otherNicks:
+        candidates = r'\b(?:{})\b|{}'.format(
+            '|'.join(map(re.escape, otherNicks)), candidates)
+    nickWordsPattern = r'(?<!&)(?P<nick>{})'.format(candidates)
+    return EnhanceRegexes(
+        re.compile('{}|{}'.format(URL_PATTERN, nickWordsPattern)),
+        re.compile(nickWordsPattern))
+
+
+def enhanceMessageLine(msg, regexes, nickColors):
     """ Applies various enhancements to <msg>, such as transforming URLs into
-    clickable links and colorizing nicks.
-    `regexpReplace` must be a list of (regexp, pattern) ready to be fed to
-    `re.sub`. """
-
-    def shieldTags(func):
-        def splitAtMatchingTag(msg):
-            opening = 0
-            for pos in range(len(msg)):
-                ch = msg[pos]
-                if ch == '<':
-                    opening += 1
-                elif ch == '>':
-                    opening -= 1
-                    if opening < 0:
-                        return msg[:pos], msg[pos+1:]
-            return '', msg  # No tag closing found
-
-        def decorated(msg):
-            spl = msg.split('<')
-            out = func(spl[0]) if len(spl) > 0 else ''
-            for part in spl[1:]:
-                inTag, afterTag = splitAtMatchingTag(part)
-                out += '<' + inTag + '>' + func(afterTag)
-            return out
-        return decorated
-
-    def clickableUrls(msg):
-        ''' Makes URLs clickable links '''
-        # This regex was originally taken from
-        # http://stackoverflow.com/a/3809435 (but then modified a lot)
-        URL_REGEX = re.compile(r"(\bhttps?://[-a-zA-Z0-9@:%._+~#=?&/]{2,}\b)")
-        return re.sub(URL_REGEX, r'<a href="\1">\1</a>', msg)
-
-    @shieldTags
-    def applyColors(msg):
-        ''' Colorizes the nicks in `msg` with their color in weechat '''
-        lastStop = 0  # exclusive
-        curMsg = ''
-        for match in colorsRegex.finditer(msg):
-            curMsg += msg[lastStop:match.start()]
-            lastStop = match.end()
-            nick = match.group(1)
-            curMsg += '<span class="color-{}">{}</span>'.format(
-                nickColors[nick], nick)
-        return curMsg + msg[lastStop:]
-
-    return applyColors(clickableUrls(msg))
-
-
-@wrapInHtml
-def renderHtml(lines, buff):
-    """ Formats the given log <lines> into a HTML string. """
-    def escape(s):
-        s = weechat.string_remove_color(s, '')
-        s = s.replace('&', '&amp;') \
-             .replace('<', '&lt;') \
-             .replace('>', '&gt;')
-        return s
+    clickable links and colorizing nicks, in a single pass over <msg>.
+    `regexes` must be built by `mkEnhanceRegexes` from the nicks of
+    `nickColors`. """
+
+    # Most messages have neither URLs nor nicks: finding their words is way
+    # cheaper than substituting each of them through a Python callback.
+    if '://' not in msg and (regexes.nickWords is None or
+                             nickColors.keys().isdisjoint(
+                                 regexes.nickWords.findall(msg))):
+        return msg
+
+    def enhance(match):
+        if match.lastgroup == 'url':
+            return '<a href="{0}">{0}</a>'.format(match.group('url'))
+        nick = match.group('nick')
+        color = nickColors.get(nick)
+        if color is None:
+            return nick  # Just a word
+        return '<span class="color-{}">{}</span>'.format(color, nick)
+
+    return regexes.enhance.sub(enhance, msg)
+
+
+def dayBounds(localTime):
+    """ Returns the timestamps of the midnights starting and ending the day of
+    the `time.struct_time` <localTime>. """
+    year, month, day = localTime[:3]
+    return (int(time.mktime((year, month, day, 0, 0, 0, 0, 0, -1))),
+            int(time.mktime((year, month, day + 1, 0, 0, 0, 0, 0, -1))))
+
+
+RAW_NONHUMAN_PREFIXES = frozenset(['--', '-->', '<--', '=!=', ''])
+
+NICK_PREFIX_COLORS = {
+    '!': 'owner',
+    '@': 'op',
+    '%': 'halfop',
+    '~': 'owner',  # Depends on the IRC server used
+    '+': 'voice',
+}
+
 
-    NONHUMAN_PREFIXES = [escape(x) for x in ['--', '-->', '<--', '=!=', '']]
+def escape(s):
+    """ Strips weechat's colors from <s>, and escapes it for HTML """
+    s = weechat.string_remove_color(s, '')
+    s = s.replace('&', '&amp;') \
+         .replace('<', '&lt;') \
+         .replace('>', '&gt;')
+    return s
+
+
+# `RAW_NONHUMAN_PREFIXES`, as they appear once escaped
+NONHUMAN_PREFIXES = frozenset(map(escape, RAW_NONHUMAN_PREFIXES))
+
+
+def renderHtml(lines, buff):
+    """ Formats the given log <lines> into a HTML page, yielded chunk by
+    chunk. """
+    # The same few prefixes come up on most lines
+    escapePrefix = functools.lru_cache(maxsize=256)(escape)
 
-    weechatNickColors = {}
-    for prefix in NONHUMAN_PREFIXES:
-        weechatNickColors[prefix] = 'default'
+    weechatNickColors = dict.fromkeys(NONHUMAN_PREFIXES, 'default')
 
     def nickColor(nick):
-        if nick not in weechatNickColors:
+        color = weechatNickColors.get(nick)  # Hit for almost every line
+        if color is None:
             color = weechat.info_get('nick_color_name', nick)
             weechatNickColors[nick] = color
-            return color
-        return weechatNickColors[nick]
+        return color
 
     def nicksColorsForBuffer():
         ''' Returns a dictionary of nicks to match with their color.
         Thanks colorize_nicks.py for inspiration! '''
-        nicks = {}
+        names = []
         bufferNicks = weechat.infolist_get('nicklist', buff, '')
-
         while weechat.infolist_next(bufferNicks):
             if weechat.infolist_string(bufferNicks, 'type') == 'nick':
-                nick = weechat.infolist_string(bufferNicks, 'name')
-                nicks[nick] = nickColor(nick)
+                names.append(weechat.infolist_string(bufferNicks, 'name'))
         weechat.infolist_free(bufferNicks)
 
+        # The infolist is freed early; these nicks are all human, so their
+        # colors are fetched straight from weechat, filling the cache too
+        nicks = {nick: weechat.info_get('nick_color_name', nick)
+                 for nick in names}
+        weechatNickColors.update(nicks)
         return nicks
 
-    def nickPrefixColor(nickPrefix):
-        return {
-            '!': 'owner',
-            '@': 'op',
-            '%': 'halfop',
-            '~': 'owner',  # Depends on the IRC server used
-            '+': 'voice',
-        }.get(nickPrefix, 'none')
-
-    def isLineContinuation(prefix, lastPrefix):
-        if prefix not in NONHUMAN_PREFIXES and prefix == lastPrefix:
-            return True
-        return False
-
     colorsForBuffer = nicksColorsForBuffer()
-    escapedNicks = map(re.escape, colorsForBuffer.keys())
-    nickStringForRegex = '|'.join(escapedNicks)
-    colorsRegexForBuffer = re.compile(r'\b({})\b'.format(nickStringForRegex))
+    enhanceRegexesForBuffer = mkEnhanceRegexes(colorsForBuffer)
 
     def formatRow(time, prefix, line, lastPrefix=None):
-        def nonhuman(prefix):
-            return prefix in NONHUMAN_PREFIXES
-
-        def splitPrefix(prefix):
-            if nonhuman(prefix):
-                return '', prefix
-            if prefix and prefix[0] in ['!', '@', '~', '%', '+']:
-                return prefix[0], prefix[1:]
-            return '', prefix
-
-        nickPrefix, nick = splitPrefix(prefix)
-        lineContinuation = isLineContinuation(prefix, lastPrefix)
-
-        return ('    <tr{}>'
-                + '<td>{}</td>'
-                + '<td class="color-{}">'
-                + '<span class="nc-prefix-{}">{}</span>{}</td>'
-                + '<td>{}</td>'
-                + '</tr>\n').format(
-                    ' class="non-human"' if nonhuman(prefix) else '',
-                    time,
-                    nickColor(nick),
-                    nickPrefixColor(nickPrefix),
-                    '' if lineContinuation else nickPrefix,
-                    '↳' if lineContinuation else nick,
-                    enhanceMessageLine(line,
-                                       colorsRegexForBuffer,
-                                       colorsForBuffer))
-
-    formatted = ""
-    prevDate = datetime.fromtimestamp(0)
-    lastPrefix = ""
+        isNonhuman = prefix in NONHUMAN_PREFIXES
+        # A single lookup both splits the prefix and colors it
+        prefixColor = (None if isNonhuman
+                       else NICK_PREFIX_COLORS.get(prefix[:1]))
+        if prefixColor is not None:
+            nickPrefix, nick = prefix[0], prefix[1:]
+        else:
+            nickPrefix, nick, prefixColor = '', prefix, 'none'
+        lineContinuation = not isNonhuman and prefix == lastPrefix
+
+        return renderRow(time,
+                         nickPrefix,
+                         nick,
+                         nickColor(nick),
+                         prefixColor,
+                         lineContinuation,
+                         isNonhuman,
+                         enhanceMessageLine(line,
+                                            enhanceRegexesForBuffer,
+                                            colorsForBuffer))
+
+    yield htmlHeader()
+
+    # Local aliases, cheaper to look up in the loop below than globals
+    escapeLine = escape
+    localtime, strftime = time.localtime, time.strftime
+
+    dayStart, dayEnd = 0, 0  # Bounds of the current day, none so far
+    lastPrefix = ""  # Escaped, as passed to `formatRow`
 
     for line in lines:
-        cDate = datetime.fromtimestamp(line.timestamp)
-        if cDate.date() != prevDate.date():
-            formatted += "{}    <h3>{}</h3>\n    <table>\n".format(
-                "</table>\n" if formatted != "" else "",  # first iteration
-                cDate.date().isoformat())
-        formatted += formatRow(escape(cDate.time().isoformat()),
-                               escape(line.prefix),
-                               escape(line.line),
-                               escape(lastPrefix))
-        prevDate = cDate
-        lastPrefix = line.prefix
-
-    formatted += "    </table>\n"
-    return formatted
-
-
-def writeFile(content, path):
-    """ Writes <content> to <path>, performing a few sanity checks. """
-    if os.path.exists(path):
+        timestamp = line.timestamp
+        if not dayStart <= timestamp < dayEnd:
+            localTime = localtime(timestamp)
+            yield (HTML_NEXT_DAY if dayEnd else HTML_FIRST_DAY).format(
+                strftime('%Y-%m-%d', localTime))
+            dayStart, dayEnd = dayBounds(localTime)
+            regularDay = dayEnd - dayStart == 86400  # No DST change
+        if regularDay:
+            # The time of day is plain arithmetic on the day's start
+            secs = timestamp - dayStart
+            timeOfDay = '{:02d}:{:02d}:{:02d}'.format(
+                secs // 3600, secs // 60 % 60, secs % 60)
+        else:
+            timeOfDay = strftime('%H:%M:%S', localtime(timestamp))
+        prefix = escapePrefix(line.prefix)
+        # The time is only digits and colons: no need to escape it
+        yield formatRow(timeOfDay, prefix, escapeLine(line.line), lastPrefix)
+        lastPrefix = prefix
+
+    yield "    </table>\n"
+    yield HTML_FOOTER
+
+
+def writeFile(chunks, path):
+    """ Writes the strings yielded by <chunks> to <path> as they come,
+    performing a few sanity checks. The file is removed if producing the
+    chunks fails. """
+    # O_EXCL: checking for an existing file and creating ours is atomic
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    except FileExistsError:
         raise Exception("File {} already exists.".format(path))
 
-    with open(path, 'w') as handle:
-        handle.write(content)
+    # Explicitly UTF-8, as announced in the HTML header, whatever the locale
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8',
+                       buffering=1 << 16) as handle:
+            for chunk in chunks:
+                handle.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
 
 
 def catchWeechatFail(f):
-    def wrap(*args, **kwargs):
+    @functools.wraps(f)
+    def wrap(*args, _rcOk=weechat.WEECHAT_RC_OK,
+             _rcError=weechat.WEECHAT_RC_ERROR, **kwargs):
         try:
-            if f(*args, **kwargs) == weechat.WEECHAT_RC_ERROR:
-                return weechat.WEECHAT_RC_ERROR
-            return weechat.WEECHAT_RC_OK
+            if f(*args, **kwargs) == _rcError:
+                return _rcError
+            return _rcOk
         except Exception as e:
             logError(str(e))
-            return weechat.WEECHAT_RC_ERROR
+            return _rcError
     return wrap
 
 
@@ -490,8 +575,56 @@ class StopExport(Exception):
     pass
 
 
-@catchWeechatFail
-def logexport_export_cmd(buff, exportFile, mustExportLine):
+def gatherLines(cLine, mustExportLine, startTime=None, endTime=None):
+    """ Walks the buffer back from `cLine`, feeding the lines dated between
+    `startTime` and `endTime` to `mustExportLine` (see `logexport_export_cmd`).
+
+    Returns `(gathered, reachedTop)`: an iterator over the selected lines as
+    `LogLine`s in chronological order, and whether the top of the buffer was
+    reached. This is the hot loop of an export: keep it tight. """
+
+    # Local aliases: this loop may run over tens of thousands of lines
+    hdataLine, hdataLineData = HDATA_LINE, HDATA_LINE_DATA
+    hdPointer = weechat.hdata_pointer
+    hdTime = weechat.hdata_time
+    hdString = weechat.hdata_string
+
+    # Filled from the most recent line backwards. The fields are stored in
+    # separate deques, and only zipped into `LogLine`s one at a time when
+    # rendering, to spare a tuple per gathered line.
+    timestamps, prefixes, msgs = deque(), deque(), deque()
+    pushTimestamp = timestamps.appendleft
+    pushPrefix = prefixes.appendleft
+    pushMsg = msgs.appendleft
+
+    reachedTop = True  # Only False if we `break` at some point
+    while cLine:
+        data = hdPointer(hdataLine, cLine, 'data')
+        if data:
+            timestamp = hdTime(hdataLineData, data, 'date')
+            if startTime is not None and timestamp < startTime:
+                reachedTop = False
+                break
+
+            if endTime is None or timestamp <= endTime:
+                prefix = hdString(hdataLineData, data, 'prefix')
+                msg = hdString(hdataLineData, data, 'message')
+
+                try:
+                    if mustExportLine(timestamp, prefix, msg):
+                        pushTimestamp(timestamp)
+                        pushPrefix(prefix)
+                        pushMsg(msg)
+                except StopExport:
+                    reachedTop = False
+                    break
+
+        cLine = hdPointer(hdataLine, cLine, 'prev_line')
+
+    return map(LogLine, timestamps, prefixes, msgs), reachedTop
+
+
+def logexport_export_cmd(buff, exportFile, mustExportLine, timeWindow=None):
     """ Called when an export function is called, as `/logexport time`.
 
     `exportFile` is the name of the file to which we will export.
@@ -505,71 +638,56 @@ def logexport_export_cmd(buff, exportFile, mustExportLine):
     It is eventually called with `None, None, None` when the top of the backlog
     is reached, and could raise an exception at this time if something went
     wrong.
+
+    `timeWindow`, if given, is a `(startTime, endTime)` pair of timestamps
+    (both inclusive). Lines outside of this window are never fed to
+    `mustExportLine` and their contents are not even fetched; the walk stops
+    at the first line older than `startTime`.
     """
 
-    cBuffer = weechat.hdata_get('buffer')
-    lines = weechat.hdata_pointer(cBuffer, buff, 'lines')
+    lines = weechat.hdata_pointer(HDATA_BUFFER, buff, 'lines')
     # 'lines' and not 'own_lines': match what the user sees.
 
-    cLine = weechat.hdata_pointer(weechat.hdata_get('lines'),
-                                  lines, 'last_line')
-    hdata_line = weechat.hdata_get('line')
-    hdata_line_data = weechat.hdata_get('line_data')
+    cLine = weechat.hdata_pointer(HDATA_LINES, lines, 'last_line')
 
-    gathered = []
-    reachedTop = True  # Only False if we `break` at some point
-    while cLine:
-        data = weechat.hdata_pointer(hdata_line, cLine, 'data')
-        if data:
-            timestamp = weechat.hdata_time(hdata_line_data, data, 'date')
-            prefix = weechat.hdata_string(hdata_line_data, data, 'prefix')
-            msg = weechat.hdata_string(hdata_line_data, data, 'message')
-
-            try:
-                if mustExportLine(timestamp, prefix, msg):
-                    gathered.append(LogLine(timestamp, prefix, msg))
-            except StopExport:
-                reachedTop = False
-                break
+    startTime, endTime = timeWindow if timeWindow else (None, None)
 
-        cLine = weechat.hdata_pointer(hdata_line, cLine, 'prev_line')
+    gathered, reachedTop = gatherLines(cLine, mustExportLine,
+                                       startTime, endTime)
 
     if reachedTop:
         # Give `mustExportLine` the chance to signal something went wrong.
         mustExportLine(None, None, None)
 
-    html = renderHtml(gathered[::-1], buff)
-    writeFile(html, formatFilePath(exportFile))
+    writeFile(renderHtml(gathered, buff), formatFilePath(exportFile))
 
 
-@catchWeechatFail
 def exportWithTimes(buff, args, rawargs):
     """ Called upon `/logexport time[stamp]` """
 
-    if len(args) not in [2, 3]:
-        raise Exception("missing or trailing parameters for 'time'.")
-
-    start_time = timestampOfString(args[0])
     if len(args) == 2:  # No end timestamp provided
-        end_time = time.time()
+        start_str, outfile = args
+        end_str = None
+    elif len(args) == 3:
+        start_str, end_str, outfile = args
     else:
-        end_time = timestampOfString(args[1])
+        raise Exception("missing or trailing parameters for 'time'.")
+    start_time = timestampOfString(start_str)
+    end_time = time.time() if end_str is None else timestampOfString(end_str)
 
-    outfile = args[-1]
+    # Line dates are whole seconds: compare them against ints, not floats
+    start_time, end_time = int(start_time), int(end_time)
 
     def shouldExport(timestamp, prefix, msg):
-        if (timestamp, prefix, msg) == (None, None, None):
-            return True  # Nothing can go wrong.
-        if timestamp < start_time:
-            raise StopExport
-        if timestamp <= end_time:
-            return True
-        return False
+        return True  # The time window does the filtering
 
-    return logexport_export_cmd(buff, outfile, shouldExport)
+    return logexport_export_cmd(buff, outfile, shouldExport,
+                                (start_time, end_time))
+
+
+MATCH_DELIMITER_REGEX = re.compile(r' (?:\.\.\.|…) ')
 
 
-@catchWeechatFail
 def exportWithTextMatch(buff, args, rawargs):
     """ Called upon `/logexport match` """
 
@@ -580,15 +698,10 @@ def exportWithTextMatch(buff, args, rawargs):
     except ValueError:
         raise Exception("Missing parameter(s) for 'match'.")
 
-    def posmin(x, y):
-        return x if (x < y and x >= 0) else y
-
-    delimitersSplitPos = posmin(rawargs.find(' ... '),
-                                rawargs.find(' … '))
-    if delimitersSplitPos >= 0:
-        delimFrom = rawargs[:delimitersSplitPos].strip()
-        toPos = rawargs.find(' ', delimitersSplitPos+1)  # Cannot fail
-        delimTo = rawargs[toPos:].strip()
+    delimiter = MATCH_DELIMITER_REGEX.search(rawargs)
+    if delimiter is not None:
+        delimFrom = rawargs[:delimiter.start()].strip()
+        delimTo = rawargs[delimiter.end():].strip()
     else:
         delimFrom = rawargs.strip()
         delimTo = None
@@ -626,7 +739,6 @@ def exportWithTextMatch(buff, args, rawargs):
     return logexport_export_cmd(buff, outfile, shouldExport)
 
 
-@catchWeechatFail
 def exportWithWhole(buff, args, rawargs):
     ''' Called upon `/logexport whole` '''
     if len(args) != 1:
@@ -639,7 +751,6 @@ def exportWithWhole(buff, args, rawargs):
     return logexport_export_cmd(buff, outfile, shouldExport)
 
 
-@catchWeechatFail
 def helpMsg(buff, args, rawargs):
     """ Displays help about a command """
     COMMANDS_HELPS = {
@@ -655,11 +766,22 @@ def helpMsg(buff, args, rawargs):
         return
 
     help_proto, help_text = COMMANDS_HELPS[args[0]]
-    weechat.prnt('', '')  # Skip a line
-    weechat.prnt('', '{}Logexport help: {}{}'.format(
-        weechat.color('*lightgreen'), args[0], weechat.color('default')))
-    weechat.prnt('', '  /logexport {} {}\n\n'.format(args[0], help_proto))
-    weechat.prnt('', help_text)
+    # A single `prnt`: weechat splits the message on newlines by itself
+    weechat.prnt('', '\n'.join([
+        '',  # Skip a line
+        '{}Logexport help: {}{}'.format(
+            weechat.color('*lightgreen'), args[0], weechat.color('default')),
+        '  /logexport {} {}\n\n'.format(args[0], help_proto),
+        help_text]))
+
+
+ACTION_OF_ARG = {
+    'time': exportWithTimes,
+    'timestamp': exportWithTimes,
+    'match': exportWithTextMatch,
+    'whole': exportWithWhole,
+    'help': helpMsg,
+}
 
 
 weechat.hook_command(
@@ -672,17 +794,10 @@ weechat.hook_command(
     "")
 
 
+@catchWeechatFail
 def logexport_cmd(data, buff, rawArgs):
     """ Command called by weechat upon /logexport """
 
-    ACTION_OF_ARG = {
-        'time': exportWithTimes,
-        'timestamp': exportWithTimes,
-        'match': exportWithTextMatch,
-        'whole': exportWithWhole,
-        'help': helpMsg,
-    }
-
     args = rawArgs.strip().split()
     if len(args) < 1:
         logError("expected at least one argument.")
@@ -690,8 +805,8 @@ def logexport_cmd(data, buff, rawArgs):
 
     nRawArgs = rawArgs[len(args[0]):].strip()
 
-    try:
-        return ACTION_OF_ARG[args[0]](buff, args[1:], nRawArgs)
-    except KeyError:
+    action = ACTION_OF_ARG.get(args[0])
+    if action is None:
         logError("unkwown action {}.".format(args[0]))
         return weechat.WEECHAT_RC_ERROR
+    return action(buff, args[1:], nRawArgs)